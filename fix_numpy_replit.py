@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Repair script for broken numpy/pandas installs on Replit
+Upgrades the scientific stack in place, forcing a clean reinstall
+when the packages still fail to import afterwards
+"""
+
+import shutil
+import subprocess
+import sys
+
+def run_command(cmd):
+    """Run a command (argv list), stream its output and return True on success"""
+    print(f"Running: {' '.join(cmd)}")
+    # Forward output line by line instead of buffering the whole log:
+    # progress is visible immediately and memory stays at one line
+    # instead of the full multi-MB pip transcript
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1, text=True
+    )
+    for line in proc.stdout:
+        sys.stdout.write(line)
+    if proc.wait() != 0:
+        # Plain returncode check - no exception object or traceback to
+        # build and unwind on the (not uncommon) failure path
+        print(f"Command failed: {' '.join(cmd)} (exit {proc.returncode})")
+        return False
+    return True
+
+def install_packages(packages, force=False):
+    """Upgrade packages in place, retrying with a forced reinstall on ABI errors.
+
+    With force=True the upgrade is skipped and the packages are reinstalled
+    outright - needed when a corrupted install satisfies pip's version check
+    but breaks at import time.
+    """
+    uv = shutil.which("uv")
+    if uv:
+        # uv's Rust resolver and parallel downloader make the whole batch
+        # bandwidth-bound instead of resolver-bound
+        base = [uv, "pip", "install", "--system"]
+        reinstall_flag = "--reinstall"
+    else:
+        base = [sys.executable, "-m", "pip", "install"]
+        reinstall_flag = "--force-reinstall"
+    if force:
+        return run_command([*base, reinstall_flag, *packages])
+    result = subprocess.run(
+        [*base, "--upgrade", *packages],
+        capture_output=True, text=True,
+    )
+    if result.returncode == 0:
+        return True
+    stderr = result.stderr or ""
+    if "binary incompatibility" in stderr or "dtype size changed" in stderr:
+        # Genuinely mismatched C extensions - only now pay for a rebuild
+        print(f"ABI mismatch, retrying with {reinstall_flag}")
+        return run_command([*base, reinstall_flag, *packages])
+    print(f"Command failed: {' '.join([*base, '--upgrade', *packages])}")
+    if stderr:
+        print(stderr)
+    return False
+
+def verify_stack():
+    """Import numpy/pandas in a fresh interpreter and report whether it worked"""
+    return run_command([
+        sys.executable, "-c",
+        "import numpy, pandas; print('numpy', numpy.__version__, '/ pandas', pandas.__version__)",
+    ])
+
+def main():
+    print("=" * 60)
+    print("FIXING NUMPY/PANDAS ON REPLIT")
+    print("=" * 60)
+
+    # Try to get uv for the reinstalls below; if the bootstrap fails,
+    # install_packages quietly falls back to pip
+    if shutil.which("uv") is None:
+        subprocess.run(
+            [sys.executable, "-m", "pip", "install", "--quiet", "uv"],
+            capture_output=True,
+        )
+
+    # Upgrade in place rather than uninstall + purge + force-reinstall:
+    # keeping pip's wheel cache means repeat runs restore packages from
+    # ~/.cache/pip in seconds instead of rebuilding from source
+
+    # numpy has to land first - pandas builds against its C API
+    install_packages(["numpy==1.26.2"])
+
+    # The rest goes to pip as one batched invocation: a single pip process
+    # resolves and downloads everything instead of paying its ~1s startup
+    # once per package
+    install_order = [
+        "pandas==2.1.4",
+        "Flask==3.0.0",
+        "Werkzeug==3.0.1",
+        "requests==2.31.0",
+        "openrouteservice==2.3.3",
+        "geopy==2.4.0",
+    ]
+    if install_packages(install_order):
+        print(f"Reinstalled {len(install_order)} packages")
+    else:
+        print("WARNING: could not reinstall all packages")
+
+    # Verify the repair in a fresh interpreter (this process may still hold
+    # the old broken modules)
+    print("Verifying installation...")
+    if not verify_stack():
+        # A corrupted install at the pinned version satisfies pip, so the
+        # upgrades above were no-ops and the breakage only shows up at
+        # import time - now force a clean reinstall of the whole stack
+        print("Import check failed - forcing a reinstall of the stack")
+        install_packages(["numpy==1.26.2"], force=True)
+        install_packages(install_order, force=True)
+        if not verify_stack():
+            print("Repair failed - check the pip output above")
+            return 1
+    print("numpy/pandas stack repaired successfully")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
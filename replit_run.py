@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Startup script for running the Route Optimizer on Replit
+Installs dependencies, checks the environment, then launches the Flask app
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+
+REQUIREMENTS_STAMP = os.path.join("uploads", ".req.stamp")
+
+def install_command(*args):
+    """Build an install argv, preferring uv's Rust resolver when available"""
+    uv = shutil.which("uv")
+    if uv:
+        return [uv, "pip", "install", "--system", *args]
+    return [sys.executable, "-m", "pip", "install", *args]
+
+def ensure_uv():
+    """Bootstrap uv once - its parallel downloader and shared wheel cache
+    make the actual install phase bandwidth-bound instead of resolver-bound"""
+    if shutil.which("uv") is None:
+        subprocess.run(
+            [sys.executable, "-m", "pip", "install", "--quiet", "uv"],
+            capture_output=True,
+        )
+
+def run_command(cmd):
+    """Run a command (argv list), stream its output and return True on success"""
+    print(f"Running: {' '.join(cmd)}")
+    # Forward output line by line instead of buffering the whole log:
+    # pip progress shows up in the Replit console immediately and memory
+    # stays at one line instead of the full multi-MB transcript
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1, text=True
+    )
+    for line in proc.stdout:
+        sys.stdout.write(line)
+    if proc.wait() != 0:
+        # Plain returncode check - no exception object or traceback to
+        # build and unwind on the (not uncommon) failure path
+        print(f"Command failed: {' '.join(cmd)} (exit {proc.returncode})")
+        return False
+    return True
+
+def main():
+    print("=" * 60)
+    print("REPLIT STARTUP - ROUTE OPTIMIZER")
+    print("=" * 60)
+
+    # Only upgrade pip when it's actually too old. The unconditional upgrade
+    # cost a full pip subprocess (~1s) on every boot just to report
+    # "Requirement already satisfied"; checking the version in-process is free
+    import pip
+    if tuple(int(part) for part in pip.__version__.split(".")[:2]) < (23, 0):
+        run_command([sys.executable, "-m", "pip", "install", "--upgrade", "pip"])
+
+    # One directory scan replaces the individual exists() checks below -
+    # each stat serializes on Replit's overlay filesystem
+    top_level = {entry.name for entry in os.scandir(".")}
+    if "uploads" not in top_level:
+        try:
+            # mkdir is one syscall; makedirs stats every path component
+            os.mkdir("uploads")
+        except FileExistsError:
+            pass
+
+    # Install the dependency set in one go - but only when it actually
+    # changed. Container restarts are frequent on Replit and a full resolve
+    # on every boot dominates startup time, so remember the hash of the last
+    # successfully installed requirements file in a stamp file.
+    # requirements.lock (exact transitive pins + hashes, produced with
+    # pip-compile or uv pip compile) takes priority over requirements.txt:
+    # the resolution work is already done, so pip can skip its resolver
+    use_lock = "requirements.lock" in top_level
+    req_file = "requirements.lock" if use_lock else "requirements.txt"
+    installed = False
+    if use_lock or "requirements.txt" in top_level:
+        with open(req_file, "rb") as f:
+            req_hash = hashlib.blake2b(f.read()).hexdigest()
+        try:
+            with open(REQUIREMENTS_STAMP) as f:
+                stamp = f.read().strip()
+        except OSError:
+            stamp = None
+
+        if stamp == req_hash:
+            print("Requirements unchanged since last boot - skipping pip")
+            installed = True
+        elif use_lock:
+            ensure_uv()
+            # --no-deps skips resolution entirely and --require-hashes keeps
+            # the installer from fetching any metadata beyond the lockfile
+            installed = run_command(
+                install_command("--no-deps", "--require-hashes", "-r", req_file)
+            )
+            if installed:
+                with open(REQUIREMENTS_STAMP, "w") as f:
+                    f.write(req_hash)
+        else:
+            ensure_uv()
+            # No (valid) stamp: a dry-run resolve is much cheaper than a
+            # real install when the environment is already satisfied
+            # (kept on pip - the "Would install" check parses pip's output)
+            dry_run = subprocess.run(
+                [sys.executable, "-m", "pip", "install", "--dry-run", "-r", "requirements.txt"],
+                capture_output=True, text=True,
+            )
+            if dry_run.returncode == 0 and "Would install" not in dry_run.stdout:
+                print("Requirements already satisfied")
+                installed = True
+            else:
+                installed = run_command(install_command("-r", "requirements.txt"))
+            if installed:
+                with open(REQUIREMENTS_STAMP, "w") as f:
+                    f.write(req_hash)
+    else:
+        print("WARNING: requirements.txt not found")
+
+    if not installed:
+        # Fall back to installing the core packages directly. numpy goes
+        # first on its own (pandas needs it at build time); the rest go out
+        # in a single batched invocation, so the installer's startup and
+        # resolver cost are paid once instead of once per package
+        ensure_uv()
+        run_command(install_command("numpy==1.26.2"))
+        packages = [
+            "Flask==3.0.0",
+            "pandas==2.1.4",
+            "Werkzeug==3.0.1",
+            "requests==2.31.0",
+            "openrouteservice==2.3.3",
+            "geopy==2.4.0",
+        ]
+        if run_command(install_command(*packages)):
+            print(f"Installed {len(packages)} packages")
+        else:
+            print("WARNING: could not install fallback packages")
+
+    if "templates" not in top_level:
+        print("WARNING: templates/ folder not found")
+
+    api_key = os.environ.get("OPENROUTESERVICE_API_KEY")
+    if api_key:
+        print(f"OpenRouteService API key found ({len(api_key)} characters)")
+    else:
+        print("No OpenRouteService API key set - postal code fallback will be used")
+
+    # Compile app.py ahead of the exec so the server skips source parsing on
+    # this boot. The .pyc lands in the project's __pycache__/, which sits on
+    # Replit's persistent volume (unlike /tmp, which is wiped on restart), so
+    # warm restarts reuse it for free; compile_file is mtime-checked, making
+    # this a no-op then. PYTHONNODEBUGRANGES shrinks bytecode written by the
+    # child interpreter
+    os.environ.setdefault("PYTHONNODEBUGRANGES", "1")
+    import compileall
+    compileall.compile_file("app.py", quiet=1)
+
+    print("Starting Flask app...")
+    # Replace this process with the Flask server instead of importing app:
+    # execvp overlays the image, so the runner's own imports and heap are
+    # released instead of staying resident for the server's whole lifetime.
+    # Run it as a module (-m): only the import machinery reads __pycache__,
+    # so a plain 'python app.py' would ignore the bytecode compiled above
+    os.execvp(sys.executable, [sys.executable, "-m", "app"])
+
+if __name__ == "__main__":
+    main()